@@ -1,6 +1,8 @@
 import os
 import abc
+import random
 import struct
+import functools
 import unittest
 import importlib
 import numpy as np
@@ -16,30 +18,84 @@ class UNSAFE_MODE:
   DISABLE_STOCK_AEB = 2
   RAISE_LONGITUDINAL_LIMITS_TO_ISO_MAX = 8
 
-def package_can_msg(msg):
-  addr, _, dat, bus = msg
-  rdlr, rdhr = struct.unpack('II', dat.ljust(8, b'\x00'))
+# RDLR, RDHR: little endian like the STM32 mailbox registers
+_CAN_UNPACK = struct.Struct('<II').unpack
+# RIR, RDTR, RDLR, RDHR: CAN_FIFOMailBox_TypeDef layout
+_MAILBOX = struct.Struct('<IIII')
+# resolved once, ffi.new with a cdecl string looks the type up on every call
+_MAILBOX_PTR = libpandasafety_py.ffi.typeof('CAN_FIFOMailBox_TypeDef *')
+# zero payloads for the common CAN lengths
+_ZERO = {n: b'\x00' * n for n in range(9)}
+
+def _mailbox_regs(addr, dat, bus):
+  if len(dat) == 8:
+    rdlr, rdhr = _CAN_UNPACK(dat)
+  elif len(dat) < 8:
+    rdlr, rdhr = _CAN_UNPACK(dat + _ZERO[8 - len(dat)])
+  else:
+    raise struct.error(f"CAN payload longer than 8 bytes: {len(dat)}")
 
-  ret = libpandasafety_py.ffi.new('CAN_FIFOMailBox_TypeDef *')
   if addr >= 0x800:
-    ret[0].RIR = (addr << 3) | 5
+    rir = (addr << 3) | 5
   else:
-    ret[0].RIR = (addr << 21) | 1
-  ret[0].RDTR = len(dat) | ((bus & 0xF) << 4)
-  ret[0].RDHR = rdhr
-  ret[0].RDLR = rdlr
-
+    rir = (addr << 21) | 1
+  rdtr = len(dat) | ((bus & 0xF) << 4)
+  return rir, rdtr, rdlr, rdhr
+
+def package_can_msg(addr, dlc, dat, bus):
+  # let cffi fill the struct from the register tuple in C
+  return libpandasafety_py.ffi.new(_MAILBOX_PTR, _mailbox_regs(addr, dat, bus))
+
+def package_can_msgs(msgs):
+  # contiguous array of mailboxes for the batched hooks, packed directly into
+  # one buffer that the returned cdata keeps alive
+  buf = bytearray(_MAILBOX.size * len(msgs))
+  for i, (addr, _, dat, bus) in enumerate(msgs):
+    _MAILBOX.pack_into(buf, i * _MAILBOX.size, *_mailbox_regs(addr, dat, bus))
+  return libpandasafety_py.ffi.from_buffer('CAN_FIFOMailBox_TypeDef[]', buf)
+
+def join_can_msgs(msgs):
+  # copy already packaged msgs into one array for the batched hooks
+  ret = libpandasafety_py.ffi.new('CAN_FIFOMailBox_TypeDef[]', len(msgs))
+  for i, msg in enumerate(msgs):
+    ret[i] = msg[0]
   return ret
 
 def make_msg(bus, addr, length=8):
-  return package_can_msg([addr, 0, b'\x00' * length, bus])
+  dat = _ZERO[length] if length in _ZERO else b'\x00' * length
+  return package_can_msg(addr, 0, dat, bus)
+
+def make_msgs(bus_addrs, length=8):
+  dat = _ZERO[length] if length in _ZERO else b'\x00' * length
+  return package_can_msgs([[addr, 0, dat, bus] for bus, addr in bus_addrs])
+
+# for the exhaustive (bus, addr) sweeps. the returned msg is shared across calls,
+# so only use it when the msg isn't modified; tests that edit the msg use make_msg
+@functools.lru_cache(maxsize=8192)
+def _make_msg_cached(bus, addr, length=8):
+  return make_msg(bus, addr, length)
 
 class CANPackerPanda(CANPacker):
-  def make_can_msg_panda(self, name_or_addr, bus, values, counter=-1, fix_checksum=None):
-    msg = self.make_can_msg(name_or_addr, bus, values, counter=-1)
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    # bind once, make_can_msg_panda is called for every packed msg
+    self._make_can_msg = super().make_can_msg
+
+  def make_can_msg_panda(self, name_or_addr, bus, values, fix_checksum=None):
+    msg = self._make_can_msg(name_or_addr, bus, values)
     if fix_checksum is not None:
       msg = fix_checksum(msg)
-    return package_can_msg(msg)
+    addr, dlc, dat, bus = msg
+    return package_can_msg(addr, dlc, dat, bus)
+
+def _gas_sample(threshold, k=32):
+  # gas pressed is a monotone compare against the threshold in all safety modes,
+  # so test the boundary values plus a seeded random sample from each side of it
+  rng = random.Random(threshold)
+  sample = {0, threshold - 1, threshold, threshold + 1, 0xFFF}
+  for values in (range(1, threshold - 1), range(threshold + 2, 0x1000)):
+    sample.update(rng.sample(values, k=min(k, len(values))))
+  return sorted(g for g in sample if 0 <= g < 0x1000)
 
 class PandaSafetyTestBase(unittest.TestCase):
   @classmethod
@@ -54,6 +110,16 @@ class PandaSafetyTestBase(unittest.TestCase):
   def _tx(self, msg):
     return self.safety.safety_tx_hook(msg)
 
+  def _tx_batch(self, msgs):
+    out = libpandasafety_py.ffi.new('int[]', len(msgs))
+    self.safety.safety_tx_hook_batch(msgs, len(msgs), out)
+    return list(out)
+
+  def _fwd_batch(self, bus, msgs):
+    out = libpandasafety_py.ffi.new('int[]', len(msgs))
+    self.safety.safety_fwd_hook_batch(bus, msgs, len(msgs), out)
+    return list(out)
+
 class InterceptorSafetyTest(PandaSafetyTestBase):
 
   INTERCEPTOR_THRESHOLD = 0
@@ -77,23 +143,31 @@ class InterceptorSafetyTest(PandaSafetyTestBase):
     self.safety.set_gas_interceptor_detected(False)
 
   def test_disengage_on_gas_interceptor(self):
-    for g in range(0, 0x1000):
-      self._rx(self._interceptor_msg(0, 0x201))
+    no_gas = self._interceptor_msg(0, 0x201)
+    expected, actual = [], []
+    for g in _gas_sample(self.INTERCEPTOR_THRESHOLD):
+      self._rx(no_gas)
       self.safety.set_controls_allowed(True)
       self._rx(self._interceptor_msg(g, 0x201))
       remain_enabled = g <= self.INTERCEPTOR_THRESHOLD
-      self.assertEqual(remain_enabled, self.safety.get_controls_allowed())
-      self._rx(self._interceptor_msg(0, 0x201))
-      self.safety.set_gas_interceptor_detected(False)
+      expected.append((g, remain_enabled))
+      actual.append((g, self.safety.get_controls_allowed()))
+      self._rx(no_gas)
+    self.assertEqual(expected, actual)
+    # every interceptor msg sets the detected flag, so only clear it once at the end
+    self.assertTrue(self.safety.get_gas_interceptor_detected())
+    self.safety.set_gas_interceptor_detected(False)
 
   def test_unsafe_mode_no_disengage_on_gas_interceptor(self):
     self.safety.set_controls_allowed(True)
     self.safety.set_unsafe_mode(UNSAFE_MODE.DISABLE_DISENGAGE_ON_GAS)
-    for g in range(0, 0x1000):
+    no_gas = self._interceptor_msg(0, 0x201)
+    for g in _gas_sample(self.INTERCEPTOR_THRESHOLD):
       self._rx(self._interceptor_msg(g, 0x201))
-      self.assertTrue(self.safety.get_controls_allowed())
-      self._rx(self._interceptor_msg(0, 0x201))
-      self.safety.set_gas_interceptor_detected(False)
+      self.assertTrue(self.safety.get_controls_allowed(), f"controls disallowed at gas {g}")
+      self._rx(no_gas)
+    self.assertTrue(self.safety.get_gas_interceptor_detected())
+    self.safety.set_gas_interceptor_detected(False)
     self.safety.set_unsafe_mode(UNSAFE_MODE.DEFAULT)
 
   def test_allow_engage_with_gas_interceptor_pressed(self):
@@ -104,14 +178,15 @@ class InterceptorSafetyTest(PandaSafetyTestBase):
     self._rx(self._interceptor_msg(0, 0x201))
 
   def test_gas_interceptor_safety_check(self):
-    for gas in np.arange(0, 4000, 100):
-      for controls_allowed in [True, False]:
-        self.safety.set_controls_allowed(controls_allowed)
-        if controls_allowed:
-          send = True
-        else:
-          send = gas == 0
-        self.assertEqual(send, self._tx(self._interceptor_msg(gas, 0x200)))
+    gas = np.arange(0, 4000, 100)
+    msgs = join_can_msgs([self._interceptor_msg(g, 0x200) for g in gas.tolist()])
+    for controls_allowed in [True, False]:
+      self.safety.set_controls_allowed(controls_allowed)
+      # any gas is allowed with controls allowed, otherwise only zero gas
+      expected = controls_allowed | (gas == 0)
+      actual = np.array(self._tx_batch(msgs), dtype=bool)
+      self.assertTrue(np.array_equal(expected, actual),
+                      f"controls_allowed={controls_allowed}, wrong tx for gas {gas[expected != actual]}")
 
 
 class TorqueSteeringSafetyTest(PandaSafetyTestBase):
@@ -291,25 +366,31 @@ class PandaSafetyTest(PandaSafetyTestBase):
     self.assertTrue(self.safety.get_relay_malfunction())
     for a in range(1, 0x800):
       for b in range(0, 3):
-        self.assertFalse(self._tx(make_msg(b, a, 8)))
-        self.assertEqual(-1, self.safety.safety_fwd_hook(b, make_msg(b, a, 8)))
+        msg = _make_msg_cached(b, a, 8)
+        self.assertFalse(self._tx(msg))
+        self.assertEqual(-1, self.safety.safety_fwd_hook(b, msg))
 
   def test_fwd_hook(self):
     # some safety modes don't forward anything, while others blacklist msgs
+    # blacklist is built here and not in setUpClass since some tests modify it
+    blacklisted_addrs = {b: frozenset(addrs) for b, addrs in self.FWD_BLACKLISTED_ADDRS.items()}
+    expected, actual = [], []
+    addrs = range(0x1, 0x800)
     for bus in range(0x0, 0x3):
-      for addr in range(0x1, 0x800):
-        # assume len 8
-        msg = make_msg(bus, addr, 8)
-        fwd_bus = self.FWD_BUS_LOOKUP.get(bus, -1)
-        if bus in self.FWD_BLACKLISTED_ADDRS and addr in self.FWD_BLACKLISTED_ADDRS[bus]:
-          fwd_bus = -1
-        self.assertEqual(fwd_bus, self.safety.safety_fwd_hook(bus, msg))
+      fwd_bus = self.FWD_BUS_LOOKUP.get(bus, -1)
+      blacklisted = blacklisted_addrs.get(bus, frozenset())
+      # assume len 8
+      msgs = make_msgs([(bus, addr) for addr in addrs], 8)
+      expected += [(bus, addr, -1 if addr in blacklisted else fwd_bus) for addr in addrs]
+      actual += [(bus, addr, fwd) for addr, fwd in zip(addrs, self._fwd_batch(bus, msgs))]
+    self.assertEqual(expected, actual)
 
   def test_spam_can_buses(self):
-    for addr in range(1, 0x800):
-      for bus in range(0, 4):
-        if all(addr != m[0] or bus != m[1] for m in self.TX_MSGS):
-          self.assertFalse(self._tx(make_msg(bus, addr, 8)))
+    tx_msgs = frozenset((addr, bus) for addr, bus in self.TX_MSGS)
+    bus_addrs = [(bus, addr) for addr in range(1, 0x800) for bus in range(0, 4)
+                 if (addr, bus) not in tx_msgs]
+    tx = self._tx_batch(make_msgs(bus_addrs, 8))
+    self.assertEqual([], [ba for ba, allowed in zip(bus_addrs, tx) if allowed])
 
   def test_default_controls_not_allowed(self):
     self.assertFalse(self.safety.get_controls_allowed())
@@ -322,8 +403,9 @@ class PandaSafetyTest(PandaSafetyTestBase):
 
   def test_prev_gas(self):
     self.assertFalse(self.safety.get_gas_pressed_prev())
+    gas_msg = self._gas_msg
     for pressed in [self.GAS_PRESSED_THRESHOLD + 1, 0]:
-      self._rx(self._gas_msg(pressed))
+      self._rx(gas_msg(pressed))
       self.assertEqual(bool(pressed), self.safety.get_gas_pressed_prev())
 
   def test_allow_engage_with_gas_pressed(self):
@@ -349,11 +431,13 @@ class PandaSafetyTest(PandaSafetyTestBase):
 
   def test_prev_brake(self):
     self.assertFalse(self.safety.get_brake_pressed_prev())
+    brake_msg = self._brake_msg
     for pressed in [True, False]:
-      self._rx(self._brake_msg(not pressed))
-      self.assertEqual(not pressed, self.safety.get_brake_pressed_prev())
-      self._rx(self._brake_msg(pressed))
-      self.assertEqual(pressed, self.safety.get_brake_pressed_prev())
+      with self.subTest(pressed=pressed):
+        self._rx(brake_msg(not pressed))
+        self.assertEqual(not pressed, self.safety.get_brake_pressed_prev())
+        self._rx(brake_msg(pressed))
+        self.assertEqual(pressed, self.safety.get_brake_pressed_prev())
 
   def test_enable_control_allowed_from_cruise(self):
     self._rx(self._pcm_status_msg(False))
@@ -367,11 +451,13 @@ class PandaSafetyTest(PandaSafetyTestBase):
     self.assertFalse(self.safety.get_controls_allowed())
 
   def test_cruise_engaged_prev(self):
+    pcm_status_msg = self._pcm_status_msg
     for engaged in [True, False]:
-      self._rx(self._pcm_status_msg(engaged))
-      self.assertEqual(engaged, self.safety.get_cruise_engaged_prev())
-      self._rx(self._pcm_status_msg(not engaged))
-      self.assertEqual(not engaged, self.safety.get_cruise_engaged_prev())
+      with self.subTest(engaged=engaged):
+        self._rx(pcm_status_msg(engaged))
+        self.assertEqual(engaged, self.safety.get_cruise_engaged_prev())
+        self._rx(pcm_status_msg(not engaged))
+        self.assertEqual(not engaged, self.safety.get_cruise_engaged_prev())
 
   def test_allow_brake_at_zero_speed(self):
     # Brake was already pressed
@@ -402,17 +488,17 @@ class PandaSafetyTest(PandaSafetyTestBase):
   def test_sample_speed(self):
     self.assertFalse(self.safety.get_vehicle_moving())
 
-    # not moving
-    self.safety.safety_rx_hook(self._speed_msg(0))
-    self.assertFalse(self.safety.get_vehicle_moving())
+    with self.subTest(case="not moving"):
+      self.safety.safety_rx_hook(self._speed_msg(0))
+      self.assertFalse(self.safety.get_vehicle_moving())
 
-    # speed is at threshold
-    self.safety.safety_rx_hook(self._speed_msg(self.STANDSTILL_THRESHOLD))
-    self.assertFalse(self.safety.get_vehicle_moving())
+    with self.subTest(case="speed is at threshold"):
+      self.safety.safety_rx_hook(self._speed_msg(self.STANDSTILL_THRESHOLD))
+      self.assertFalse(self.safety.get_vehicle_moving())
 
-    # past threshold
-    self.safety.safety_rx_hook(self._speed_msg(self.STANDSTILL_THRESHOLD + 1))
-    self.assertTrue(self.safety.get_vehicle_moving())
+    with self.subTest(case="past threshold"):
+      self.safety.safety_rx_hook(self._speed_msg(self.STANDSTILL_THRESHOLD + 1))
+      self.assertTrue(self.safety.get_vehicle_moving())
 
   def test_tx_hook_on_wrong_safety_mode(self):
     files = os.listdir(os.path.dirname(os.path.realpath(__file__)))
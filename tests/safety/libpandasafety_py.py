@@ -37,7 +37,7 @@ int get_unsafe_mode(void);
 void set_relay_malfunction(bool c);
 bool get_relay_malfunction(void);
 void set_gas_interceptor_detected(bool c);
-bool get_gas_interceptor_detetcted(void);
+bool get_gas_interceptor_detected(void);
 int get_gas_interceptor_prev(void);
 bool get_gas_pressed_prev(void);
 bool get_brake_pressed_prev(void);
@@ -62,6 +62,9 @@ int safety_tx_hook(CAN_FIFOMailBox_TypeDef *to_push);
 int safety_fwd_hook(int bus_num, CAN_FIFOMailBox_TypeDef *to_fwd);
 int set_safety_hooks(uint16_t  mode, int16_t param);
 
+void safety_tx_hook_batch(CAN_FIFOMailBox_TypeDef *msgs, int n, int *out);
+void safety_fwd_hook_batch(int bus_num, CAN_FIFOMailBox_TypeDef *msgs, int n, int *out);
+
 void init_tests(void);
 
 void init_tests_honda(void);
@@ -196,6 +196,19 @@ void set_honda_fwd_brake(bool c){
   honda_fwd_brake = c;
 }
 
+// batched hooks, one call per sweep instead of one per msg
+void safety_tx_hook_batch(CAN_FIFOMailBox_TypeDef *msgs, int n, int *out){
+  for (int i = 0; i < n; i++) {
+    out[i] = safety_tx_hook(&msgs[i]);
+  }
+}
+
+void safety_fwd_hook_batch(int bus_num, CAN_FIFOMailBox_TypeDef *msgs, int n, int *out){
+  for (int i = 0; i < n; i++) {
+    out[i] = safety_fwd_hook(bus_num, &msgs[i]);
+  }
+}
+
 void init_tests(void){
   // get HW_TYPE from env variable set in test.sh
   hw_type = atoi(getenv("HW_TYPE"));
@@ -58,15 +58,24 @@ def set_desired_torque_last(safety, mode, torque):
   elif mode == Panda.SAFETY_SUBARU:
     safety.set_subaru_desired_torque_last(torque)
 
+# RDLR, RDHR: little endian like the STM32 mailbox registers
+_CAN_UNPACK = struct.Struct('<II').unpack
+
 def package_can_msg(msg):
-  rdlr, rdhr = struct.unpack('II', msg.dat.ljust(8, b'\x00'))
+  dat = msg.dat
+  if len(dat) == 8:
+    rdlr, rdhr = _CAN_UNPACK(dat)
+  elif len(dat) < 8:
+    rdlr, rdhr = _CAN_UNPACK(dat + b'\x00' * (8 - len(dat)))
+  else:
+    raise struct.error(f"CAN payload longer than 8 bytes: {len(dat)}")
 
   ret = libpandasafety_py.ffi.new('CAN_FIFOMailBox_TypeDef *')
   if msg.address >= 0x800:
     ret[0].RIR = (msg.address << 3) | 5
   else:
     ret[0].RIR = (msg.address << 21) | 1
-  ret[0].RDTR = len(msg.dat) | ((msg.src & 0xF) << 4)
+  ret[0].RDTR = len(dat) | ((msg.src & 0xF) << 4)
   ret[0].RDHR = rdhr
   ret[0].RDLR = rdlr
 